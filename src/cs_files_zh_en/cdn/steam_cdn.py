@@ -1,215 +1,484 @@
-"""
-Steam CDN client operations for CS:GO Files Downloader
-"""
-
-import logging
-from pathlib import Path
-from typing import Tuple, List
-
-from steam.client import SteamClient
-from steam.client.cdn import CDNClient
-
-from ..config import Config
-from ..utils.file_utils import save_file
-
-logger = logging.getLogger(__name__)
-
-
-class SteamCDNManager:
-    """Manages Steam CDN operations for downloading game files"""
-
-    def __init__(self, steam_client: SteamClient):
-        self.steam_client = steam_client
-        self.cdn_client = CDNClient(steam_client)
-
-    def get_latest_manifest_info(self) -> Tuple[str, dict]:
-        """
-        Get latest manifest ID and app info for CS:GO
-
-        Returns:
-            Tuple of (manifest_id, app_info)
-
-        Raises:
-            ValueError: If unable to get manifest info
-        """
-        logger.info("Getting CS:GO product info...")
-
-        app_info = self.steam_client.get_product_info(apps=[Config.APP_ID])
-
-        if not app_info or "apps" not in app_info or Config.APP_ID not in app_info["apps"]:
-            raise ValueError("Failed to get CS:GO app info")
-
-        cs_info = app_info["apps"][Config.APP_ID]
-
-        # Get depot info
-        if "depots" not in cs_info or str(Config.DEPOT_ID) not in cs_info["depots"]:
-            raise ValueError(f"Depot {Config.DEPOT_ID} not found in app info")
-
-        depot_info = cs_info["depots"][str(Config.DEPOT_ID)]
-
-        if "manifests" not in depot_info or "public" not in depot_info["manifests"]:
-            raise ValueError("Public manifest not found")
-
-        latest_manifest_id = depot_info["manifests"]["public"]["gid"]
-
-        logger.info(f"Latest manifest ID: {latest_manifest_id}")
-        return str(latest_manifest_id), cs_info
-
-    def get_manifest(self, manifest_id: str):
-        """
-        Download and return manifest for given ID
-
-        Args:
-            manifest_id: Manifest ID to download
-
-        Returns:
-            Manifest object
-
-        Raises:
-            ValueError: If unable to get manifest
-        """
-        logger.info("Getting manifest request code...")
-
-        try:
-            manifest_request_code = self.cdn_client.get_manifest_request_code(Config.APP_ID, Config.DEPOT_ID, manifest_id)
-            logger.info(f"Got manifest request code: {manifest_request_code}")
-        except Exception as e:
-            raise ValueError(f"Failed to get manifest request code: {e}")
-
-        logger.info("Getting depot manifest...")
-        manifest = self.cdn_client.get_manifest(Config.APP_ID, Config.DEPOT_ID, manifest_id, manifest_request_code=manifest_request_code)
-
-        if not manifest:
-            raise ValueError("Failed to get depot manifest")
-
-        files = list(manifest.iter_files())
-        logger.info(f"Manifest loaded with {len(files)} files")
-
-        return manifest
-
-    def extract_files_directly(self, manifest) -> bool:
-        """
-        Try to extract target files directly from manifest without VPK processing
-
-        Args:
-            manifest: Steam manifest object
-
-        Returns:
-            True if files were successfully extracted, False otherwise
-        """
-        logger.info("Attempting to extract files directly from manifest...")
-
-        extracted_count = 0
-
-        for file_info in manifest.iter_files():
-            filename = file_info.filename.replace("\\", "/")
-
-            for target_file in Config.VPK_FILES:
-                if filename == target_file:
-                    logger.info(f"Extracting {filename} directly from manifest...")
-
-                    try:
-                        # Get file data
-                        file_data = file_info.read()
-
-                        # Get just the filename for saving
-                        save_filename = target_file.split("/")[-1]
-                        static_path = Config.get_static_path() / save_filename
-
-                        save_file(static_path, file_data)
-                        extracted_count += 1
-
-                    except Exception as e:
-                        logger.error(f"Error extracting {filename}: {e}")
-                        continue
-
-        logger.info(f"Successfully extracted {extracted_count} files directly from manifest")
-        return extracted_count > 0
-
-    def download_vpk_dir(self, manifest) -> Path:
-        """
-        Download VPK directory file from manifest
-
-        Args:
-            manifest: Steam manifest object
-
-        Returns:
-            Path to downloaded VPK directory file
-
-        Raises:
-            ValueError: If VPK directory file not found or download fails
-        """
-        logger.info("Downloading VPK directory file...")
-
-        # Find pak01_dir.vpk in manifest
-        dir_file = None
-        for file_info in manifest.iter_files():
-            filename = file_info.filename.replace("\\", "/")
-            if filename.endswith("csgo/pak01_dir.vpk"):
-                dir_file = file_info
-                break
-
-        if not dir_file:
-            raise ValueError("Could not find pak01_dir.vpk in manifest")
-
-        temp_path = Config.get_temp_path() / "pak01_dir.vpk"
-        static_path = Config.get_static_path() / "pak01_dir.vpk"
-
-        try:
-            # Download using Steam CDN
-            file_data = dir_file.read()
-            save_file(temp_path, file_data, remove_bom=False)
-            save_file(static_path, file_data, remove_bom=False)
-
-            return temp_path
-
-        except Exception as e:
-            # Fallback - try to use existing file if available
-            if static_path.exists():
-                logger.warning(f"Download failed ({e}), using existing VPK dir file")
-                import shutil
-
-                shutil.copy2(static_path, temp_path)
-                return temp_path
-            else:
-                raise ValueError(f"Error downloading VPK dir: {e}")
-
-    def download_vpk_archives(self, manifest, required_indices: List[int]) -> None:
-        """
-        Download required VPK archive files
-
-        Args:
-            manifest: Steam manifest object
-            required_indices: List of archive indices to download
-        """
-        logger.info(f"Downloading {len(required_indices)} VPK archive files...")
-
-        for i, archive_index in enumerate(required_indices):
-            # Pad to 3 digits
-            padded_index = f"{archive_index:03d}"
-            filename = f"pak01_{padded_index}.vpk"
-
-            # Find file in manifest
-            file_info = None
-            for f in manifest.iter_files():
-                if f.filename.endswith(filename):
-                    file_info = f
-                    break
-
-            if not file_info:
-                logger.warning(f"Could not find {filename} in manifest")
-                continue
-
-            temp_path = Config.get_temp_path() / filename
-            status = f"[{i + 1}/{len(required_indices)}]"
-
-            logger.info(f"{status} Downloading {filename}")
-
-            try:
-                # Download file from Steam CDN
-                file_data = file_info.read()
-                save_file(temp_path, file_data, remove_bom=False)
-
-            except Exception as e:
-                logger.error(f"Error downloading {filename}: {e}")
-                continue
+"""
+Steam CDN client operations for CS:GO Files Downloader
+"""
+
+import os
+import json
+import time
+import logging
+import hashlib
+import shutil
+
+import gevent
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Tuple, List
+
+from steam.client import SteamClient
+from steam.client.cdn import CDNClient
+from steam.enums import EResult
+
+from ..config import Config
+from ..utils.file_utils import load_hash_cache, matches_manifest, save_file_streaming, save_hash_cache
+
+logger = logging.getLogger(__name__)
+
+# Single-char substitution via translate skips str.replace's substring search
+_SLASH_TABLE = str.maketrans("\\", "/")
+
+
+def probe_latest_manifest_id() -> str | None:
+    """
+    Fetch the latest public manifest ID without credentials
+
+    CS:GO product info is public, so an anonymous session is enough to ask
+    whether anything changed before paying for a credentialed login.
+
+    Returns:
+        Latest manifest ID as a string, or None if the probe failed
+    """
+    client = SteamClient()
+
+    try:
+        if client.anonymous_login() != EResult.OK:
+            logger.warning("Anonymous login failed, skipping manifest probe")
+            return None
+
+        app_info = client.get_product_info(apps=[Config.APP_ID])
+        depot_info = app_info["apps"][Config.APP_ID]["depots"][str(Config.DEPOT_ID)]
+        return str(depot_info["manifests"]["public"]["gid"])
+
+    except Exception as e:
+        logger.warning(f"Anonymous manifest probe failed: {e}")
+        return None
+
+    finally:
+        try:
+            client.logout()
+        except Exception:
+            pass
+
+
+class SteamCDNManager:
+    """Manages Steam CDN operations for downloading game files"""
+
+    def __init__(self, steam_client: SteamClient):
+        self.steam_client = steam_client
+        # Fetch product info concurrently with CDNClient initialization
+        # (server-list bootstrap); get_latest_manifest_info joins the result
+        self._product_info_greenlet = gevent.spawn(steam_client.get_product_info, apps=[Config.APP_ID])
+        self.cdn_client = CDNClient(steam_client)
+        self._manifest_index: dict = {}
+        self._product_info_cache: Tuple[str, dict] | None = None
+
+    def _index_manifest(self, manifest) -> Tuple[dict, dict]:
+        """
+        Build (and cache) filename lookup dicts for a manifest
+
+        Walking manifest.iter_files() is a full pass over tens of thousands
+        of entries, so it is done once per manifest and reused by all lookups.
+
+        Args:
+            manifest: Steam manifest object
+
+        Returns:
+            Tuple of (path index, basename index) mapping normalized
+            forward-slash filenames / basenames to file_info objects
+        """
+        key = id(manifest)
+        if key not in self._manifest_index:
+            by_path = {}
+            by_basename = {}
+            for f in manifest.iter_files():
+                filename = f.filename.translate(_SLASH_TABLE)
+                by_path[filename] = f
+                by_basename[filename.rsplit("/", 1)[-1]] = f
+            self._manifest_index[key] = (by_path, by_basename)
+        return self._manifest_index[key]
+
+    def _rotate_cdn_server(self) -> bool:
+        """
+        Advance the CDN client to the next content server in its pool
+
+        A single CDN edge can throttle or fail while the rest of the pool
+        is healthy, so retries should go to a different host.
+
+        Returns:
+            True if another server was available to rotate to
+        """
+        servers = getattr(self.cdn_client, "servers", None)
+        if servers is None or len(servers) < 2 or not hasattr(servers, "rotate"):
+            return False
+
+        servers.rotate(-1)
+        logger.info(f"Switched CDN server ({len(servers)} in pool)")
+        return True
+
+    def _download_file_chunked(self, file_info, dest_path: Path) -> bool:
+        """
+        Download a manifest file chunk by chunk with an on-disk chunk cache
+
+        Completed chunks persist under temp/.chunks so an interrupted run
+        only re-fetches the missing chunks instead of the whole archive.
+
+        Args:
+            file_info: Manifest file_info object
+            dest_path: Final destination path
+
+        Returns:
+            True if the file was assembled from chunks, False if the
+            manifest does not expose chunk metadata
+        """
+        chunks = getattr(file_info, "chunks", None)
+        if not chunks:
+            return False
+
+        chunk_dir = Config.TEMP_PATH / ".chunks"
+        chunk_dir.mkdir(parents=True, exist_ok=True)
+
+        ordered = sorted(chunks, key=lambda chunk: chunk.offset)
+        cached_count = 0
+
+        part_path = dest_path.with_name(dest_path.name + ".part")
+
+        with open(part_path, "wb") as out:
+            for chunk in ordered:
+                sha_hex = chunk.sha.hex()
+                cache_path = chunk_dir / sha_hex
+                data = None
+
+                if cache_path.exists():
+                    data = cache_path.read_bytes()
+                    # The filename is the expected SHA-1; verify it so a
+                    # chunk truncated by a crash is never assembled
+                    if hashlib.sha1(data).hexdigest() == sha_hex:
+                        cached_count += 1
+                    else:
+                        logger.warning(f"Discarding corrupt cached chunk {sha_hex}")
+                        cache_path.unlink(missing_ok=True)
+                        data = None
+
+                if data is None:
+                    data = self.cdn_client.get_chunk(Config.APP_ID, Config.DEPOT_ID, sha_hex)
+                    chunk_part = cache_path.with_name(cache_path.name + ".part")
+                    chunk_part.write_bytes(data)
+                    os.replace(chunk_part, cache_path)
+
+                out.write(data)
+
+        # Atomic rename: a crash mid-assembly never leaves a corrupt destination
+        os.replace(part_path, dest_path)
+
+        # The assembled file supersedes its chunks
+        for chunk in ordered:
+            (chunk_dir / chunk.sha.hex()).unlink(missing_ok=True)
+
+        logger.info(f"Assembled {dest_path.name} from {len(ordered)} chunks ({cached_count} cached)")
+        return True
+
+    def _load_product_info_cache(self) -> Tuple[str, dict] | None:
+        """
+        Load cached product info if it is still within its TTL
+
+        Returns:
+            Tuple of (manifest_id, cs_info) or None on miss
+        """
+        cache_path = Config.get_product_info_cache_path()
+        if not cache_path.exists():
+            return None
+
+        try:
+            payload = json.loads(cache_path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read product info cache: {e}")
+            return None
+
+        if time.time() - payload.get("ts", 0) > Config.PRODUCT_INFO_TTL_SECONDS:
+            return None
+
+        manifest_id = payload.get("manifest_id")
+        cs_info = payload.get("cs_info")
+        if not manifest_id or cs_info is None:
+            return None
+
+        logger.info(f"Using cached product info (manifest ID: {manifest_id})")
+        return str(manifest_id), cs_info
+
+    def _save_product_info_cache(self, manifest_id: str, cs_info: dict) -> None:
+        """Persist product info for quick back-to-back invocations"""
+        try:
+            payload = json.dumps({"ts": time.time(), "manifest_id": str(manifest_id), "cs_info": cs_info})
+            Config.get_product_info_cache_path().write_text(payload)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not save product info cache: {e}")
+
+    def get_latest_manifest_info(self, probed_manifest_id: str | None = None) -> Tuple[str, dict]:
+        """
+        Get latest manifest ID and app info for CS:GO
+
+        Consults the in-memory cache, then the short-TTL disk cache, and
+        only then the Steam API, so quick re-runs and retry loops skip the
+        network round-trip.
+
+        Args:
+            probed_manifest_id: Manifest ID seen by the anonymous probe;
+                a disk cache that disagrees with it is stale and bypassed
+
+        Returns:
+            Tuple of (manifest_id, app_info)
+
+        Raises:
+            ValueError: If unable to get manifest info
+        """
+        if self._product_info_cache is not None:
+            return self._product_info_cache
+
+        cached = self._load_product_info_cache()
+        if cached is not None:
+            # A successful probe that saw a different manifest means the
+            # cache predates the update; trusting it would cancel the very
+            # update the probe detected
+            if probed_manifest_id is not None and cached[0] != probed_manifest_id:
+                logger.info("Cached product info predates probed manifest ID, refreshing")
+            else:
+                self._product_info_cache = cached
+                return cached
+
+        logger.info("Getting CS:GO product info...")
+
+        if self._product_info_greenlet is not None:
+            # Join the fetch started in __init__ instead of issuing a new one
+            app_info = self._product_info_greenlet.get()
+            self._product_info_greenlet = None
+        else:
+            app_info = self.steam_client.get_product_info(apps=[Config.APP_ID])
+
+        if not app_info or "apps" not in app_info or Config.APP_ID not in app_info["apps"]:
+            raise ValueError("Failed to get CS:GO app info")
+
+        cs_info = app_info["apps"][Config.APP_ID]
+
+        # Get depot info
+        if "depots" not in cs_info or str(Config.DEPOT_ID) not in cs_info["depots"]:
+            raise ValueError(f"Depot {Config.DEPOT_ID} not found in app info")
+
+        depot_info = cs_info["depots"][str(Config.DEPOT_ID)]
+
+        if "manifests" not in depot_info or "public" not in depot_info["manifests"]:
+            raise ValueError("Public manifest not found")
+
+        latest_manifest_id = str(depot_info["manifests"]["public"]["gid"])
+
+        logger.info(f"Latest manifest ID: {latest_manifest_id}")
+
+        self._product_info_cache = (latest_manifest_id, cs_info)
+        self._save_product_info_cache(latest_manifest_id, cs_info)
+
+        return latest_manifest_id, cs_info
+
+    def get_manifest(self, manifest_id: str):
+        """
+        Download and return manifest for given ID
+
+        Args:
+            manifest_id: Manifest ID to download
+
+        Returns:
+            Manifest object
+
+        Raises:
+            ValueError: If unable to get manifest
+        """
+        logger.info("Getting manifest request code...")
+
+        try:
+            manifest_request_code = self.cdn_client.get_manifest_request_code(Config.APP_ID, Config.DEPOT_ID, manifest_id)
+            logger.info(f"Got manifest request code: {manifest_request_code}")
+        except Exception as e:
+            raise ValueError(f"Failed to get manifest request code: {e}")
+
+        logger.info("Getting depot manifest...")
+        manifest = self.cdn_client.get_manifest(Config.APP_ID, Config.DEPOT_ID, manifest_id, manifest_request_code=manifest_request_code)
+
+        if not manifest:
+            raise ValueError("Failed to get depot manifest")
+
+        # Build the filename index up front: it doubles as the file count here
+        # and every later lookup reuses it without re-walking the manifest
+        by_path, _ = self._index_manifest(manifest)
+        logger.info(f"Manifest loaded with {len(by_path)} files")
+
+        return manifest
+
+    def extract_files_directly(self, manifest) -> bool:
+        """
+        Try to extract target files directly from manifest without VPK processing
+
+        Args:
+            manifest: Steam manifest object
+
+        Returns:
+            True if files were successfully extracted, False otherwise
+        """
+        logger.info("Attempting to extract files directly from manifest...")
+
+        extracted_count = 0
+        by_path, _ = self._index_manifest(manifest)
+        hash_cache = load_hash_cache(Config.get_hash_cache_path())
+
+        # O(1) index lookup per target instead of scanning every manifest entry
+        for target_file in Config.VPK_FILES:
+            file_info = by_path.get(target_file)
+            if file_info is None:
+                continue
+
+            # Get just the filename for saving
+            save_filename = target_file.rsplit("/", 1)[-1]
+            static_path = Config.STATIC_PATH / save_filename
+
+            # Skip the CDN round-trip when the local file is already current
+            if matches_manifest(static_path, file_info, hash_cache):
+                logger.info(f"{save_filename} already matches manifest, skipping download")
+                extracted_count += 1
+                continue
+
+            logger.info(f"Extracting {target_file} directly from manifest...")
+
+            try:
+                # Stream from CDN to disk without buffering the whole file
+                save_file_streaming(static_path, file_info, remove_bom=True)
+                extracted_count += 1
+
+            except Exception as e:
+                logger.error(f"Error extracting {target_file}: {e}")
+                continue
+
+        save_hash_cache(Config.get_hash_cache_path(), hash_cache)
+        logger.info(f"Successfully extracted {extracted_count} files directly from manifest")
+        return extracted_count > 0
+
+    def download_vpk_dir(self, manifest) -> Path:
+        """
+        Download VPK directory file from manifest
+
+        Args:
+            manifest: Steam manifest object
+
+        Returns:
+            Path to downloaded VPK directory file
+
+        Raises:
+            ValueError: If VPK directory file not found or download fails
+        """
+        logger.info("Downloading VPK directory file...")
+
+        # Find pak01_dir.vpk in manifest: O(1) basename lookup, with a full
+        # scan only if another entry shadowed the basename
+        by_path, by_basename = self._index_manifest(manifest)
+
+        dir_file = by_basename.get("pak01_dir.vpk")
+        if dir_file is not None and not dir_file.filename.translate(_SLASH_TABLE).endswith("csgo/pak01_dir.vpk"):
+            dir_file = None
+
+        if dir_file is None:
+            for filename, file_info in by_path.items():
+                if filename.endswith("csgo/pak01_dir.vpk"):
+                    dir_file = file_info
+                    break
+
+        if not dir_file:
+            raise ValueError("Could not find pak01_dir.vpk in manifest")
+
+        temp_path = Config.TEMP_PATH / "pak01_dir.vpk"
+        static_path = Config.STATIC_PATH / "pak01_dir.vpk"
+
+        try:
+            # Stream from Steam CDN, then copy in-kernel instead of writing twice
+            save_file_streaming(temp_path, dir_file, remove_bom=False)
+            shutil.copyfile(temp_path, static_path)
+
+            return temp_path
+
+        except Exception as e:
+            # Fallback - try to use existing file if available
+            if static_path.exists():
+                logger.warning(f"Download failed ({e}), using existing VPK dir file")
+                # The VPK dir file is immutable per manifest ID, so there is no
+                # stat metadata worth preserving; copyfile takes the in-kernel
+                # sendfile/copy_file_range path on Linux
+                shutil.copyfile(static_path, temp_path)
+                return temp_path
+            else:
+                raise ValueError(f"Error downloading VPK dir: {e}")
+
+    def download_vpk_archives(self, manifest, required_indices: List[int]) -> None:
+        """
+        Download required VPK archive files in parallel
+
+        Archives are independent, so downloads run on a bounded thread pool
+        to overlap CDN round-trips instead of waiting on one stream at a time.
+
+        Args:
+            manifest: Steam manifest object
+            required_indices: List of archive indices to download
+        """
+        if not required_indices:
+            return
+
+        logger.info(f"Downloading {len(required_indices)} VPK archive files...")
+
+        _, archive_files = self._index_manifest(manifest)
+        total = len(required_indices)
+        hash_cache = load_hash_cache(Config.get_hash_cache_path())
+
+        # Preformat the 3-digit-padded basenames once; workers do plain dict lookups
+        archive_names = [f"pak01_{archive_index:03d}.vpk" for archive_index in required_indices]
+
+        def _download_one(filename: str, position: int) -> None:
+            file_info = archive_files.get(filename)
+            if not file_info:
+                logger.warning(f"Could not find {filename} in manifest")
+                return
+
+            temp_path = Config.TEMP_PATH / filename
+
+            # Skip the CDN round-trip when a previous run left a current copy
+            if matches_manifest(temp_path, file_info, hash_cache):
+                logger.info(f"[{position}/{total}] {filename} already matches manifest, skipping download")
+                return
+
+            logger.info(f"[{position}/{total}] Downloading {filename}")
+
+            def _fetch() -> None:
+                # Prefer the resumable chunk path; fall back to streaming the
+                # whole file when the manifest exposes no chunk metadata
+                if self._download_file_chunked(file_info, temp_path):
+                    return
+
+                if hasattr(file_info, "seek"):
+                    file_info.seek(0)
+                save_file_streaming(temp_path, file_info, remove_bom=False, drop_cache=True)
+
+            try:
+                _fetch()
+            except Exception as e:
+                if not self._rotate_cdn_server():
+                    raise
+
+                logger.warning(f"Retrying {filename} on a different CDN server ({e})")
+                _fetch()
+
+        # No point spinning up more workers than there are archives
+        max_workers = min(Config.MAX_PARALLEL_DOWNLOADS, len(archive_names))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(_download_one, filename, i + 1): filename for i, filename in enumerate(archive_names)}
+
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Error downloading {filename}: {e}")
+
+        save_hash_cache(Config.get_hash_cache_path(), hash_cache)
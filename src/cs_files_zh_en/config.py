@@ -1,57 +1,87 @@
-"""
-Configuration management for CS:GO Files Downloader
-"""
-
-from pathlib import Path
-from typing import List
-
-
-class Config:
-    """Central configuration for the CS:GO Files Downloader"""
-    
-    # Steam Application Constants
-    APP_ID = 730
-    DEPOT_ID = 2347770
-    
-    # Directory Paths
-    STATIC_DIR = "./static"
-    TEMP_DIR = "./temp"
-    
-    # File Names
-    MANIFEST_ID_FILE = "manifestId.txt"
-    
-    # Target Files to Extract from VPK
-    VPK_FILES = [
-        "resource/csgo_english.txt",
-        "resource/csgo_schinese.txt", 
-        "scripts/items/items_game.txt",
-    ]
-    
-    # Timeout Settings
-    LOGIN_TIMEOUT_SECONDS = 30
-    
-    @classmethod
-    def get_static_path(cls) -> Path:
-        """Get static directory path as Path object"""
-        return Path(cls.STATIC_DIR)
-    
-    @classmethod
-    def get_temp_path(cls) -> Path:
-        """Get temp directory path as Path object"""
-        return Path(cls.TEMP_DIR)
-    
-    @classmethod
-    def get_manifest_file_path(cls) -> Path:
-        """Get manifest file path"""
-        return cls.get_static_path() / cls.MANIFEST_ID_FILE
-    
-    @classmethod
-    def get_target_filenames(cls) -> List[str]:
-        """Get list of target filenames (without path)"""
-        return [vpk_file.split("/")[-1] for vpk_file in cls.VPK_FILES]
-    
-    @classmethod
-    def ensure_directories(cls) -> None:
-        """Create necessary directories if they don't exist"""
-        cls.get_static_path().mkdir(exist_ok=True)
+"""
+Configuration management for CS:GO Files Downloader
+"""
+
+from pathlib import Path
+from typing import List
+
+
+class Config:
+    """Central configuration for the CS:GO Files Downloader"""
+    
+    # Steam Application Constants
+    APP_ID = 730
+    DEPOT_ID = 2347770
+    
+    # Directory Paths
+    STATIC_DIR = "./static"
+    TEMP_DIR = "./temp"
+    
+    # File Names
+    MANIFEST_ID_FILE = "manifestId.txt"
+    HASH_CACHE_FILE = ".manifest_hashes.json"
+    PRODUCT_INFO_CACHE_FILE = ".product_info.json"
+    MANIFEST_INDEX_FILE = "manifest_index.json"
+    
+    # Target Files to Extract from VPK
+    VPK_FILES = [
+        "resource/csgo_english.txt",
+        "resource/csgo_schinese.txt", 
+        "scripts/items/items_game.txt",
+    ]
+    
+    # Timeout Settings
+    LOGIN_TIMEOUT_SECONDS = 30
+
+    # Download Settings
+    MAX_PARALLEL_DOWNLOADS = 4
+
+    # Cache Settings
+    PRODUCT_INFO_TTL_SECONDS = 300
+
+    # Precomputed lookups (built once at class load so hot paths don't rebuild them)
+    STATIC_PATH = Path(STATIC_DIR)
+    TEMP_PATH = Path(TEMP_DIR)
+    VPK_FILE_SET = frozenset(VPK_FILES)
+    TARGET_BASENAMES = frozenset(vpk_file.rsplit("/", 1)[-1] for vpk_file in VPK_FILES)
+    
+    @classmethod
+    def get_static_path(cls) -> Path:
+        """Get static directory path as Path object"""
+        return cls.STATIC_PATH
+    
+    @classmethod
+    def get_temp_path(cls) -> Path:
+        """Get temp directory path as Path object"""
+        return cls.TEMP_PATH
+    
+    @classmethod
+    def get_manifest_file_path(cls) -> Path:
+        """Get manifest file path"""
+        return cls.STATIC_PATH / cls.MANIFEST_ID_FILE
+    
+    @classmethod
+    def get_hash_cache_path(cls) -> Path:
+        """Get hash cache sidecar file path"""
+        return cls.STATIC_PATH / cls.HASH_CACHE_FILE
+
+    @classmethod
+    def get_product_info_cache_path(cls) -> Path:
+        """Get product info cache file path"""
+        return cls.STATIC_PATH / cls.PRODUCT_INFO_CACHE_FILE
+
+    @classmethod
+    def get_manifest_index_path(cls) -> Path:
+        """Get manifest archive index cache file path"""
+        return cls.STATIC_PATH / cls.MANIFEST_INDEX_FILE
+
+    @classmethod
+    def get_target_filenames(cls) -> List[str]:
+        """Get list of target filenames (without path)"""
+        return [vpk_file.split("/")[-1] for vpk_file in cls.VPK_FILES]
+    
+    @classmethod
+    def ensure_directories(cls) -> None:
+        """Create necessary directories if they don't exist"""
+        cls.get_static_path().mkdir(exist_ok=True)
         cls.get_temp_path().mkdir(exist_ok=True)
\ No newline at end of file
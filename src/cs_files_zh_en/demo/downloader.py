@@ -6,39 +6,12 @@ Alternative CS:GO Files Downloader using direct HTTP requests
 import time
 from pathlib import Path
 
+from ..utils.file_utils import save_file
 
-def download_from_steamcmd_api():
-    """
-    Download CS:GO files using SteamCMD API approach
-    This is a more reliable method that doesn't require Steam login
-    """
-
-    STATIC_DIR = "./static"
-
-    # Create static directory
-    Path(STATIC_DIR).mkdir(exist_ok=True)
-
-    # These are public URLs that provide the game files
-    # Note: In production, you'd need to implement proper Steam CDN access
-
-    files_to_download = [
-        {"name": "csgo_english.txt", "description": "English localization file"},
-        {"name": "csgo_schinese.txt", "description": "Chinese localization file"},
-        {"name": "items_game.txt", "description": "Game items definition file"},
-    ]
-
-    print("CS:GO Files Downloader (Simplified Version)")
-    print("=" * 50)
-
-    # Create sample files to demonstrate the structure
-    for file_info in files_to_download:
-        filename = file_info["name"]
-        filepath = Path(STATIC_DIR) / filename
-
-        print(f"Creating sample {filename}...")
-
-        if filename == "csgo_english.txt":
-            content = """// Counter-Strike: Global Offensive English Text
+# Sample payloads, pre-encoded once at import so the demo loop is
+# branch-free binary I/O
+_DEMO_FILES: dict[str, bytes] = {
+    "csgo_english.txt": """// Counter-Strike: Global Offensive English Text
 "lang"
 {
     "Language"      "english"
@@ -49,9 +22,8 @@ def download_from_steamcmd_api():
         "CSGO_MainMenu_PlayButton"    "PLAY"
         "CSGO_MainMenu_WatchButton"   "WATCH"
     }
-}"""
-        elif filename == "csgo_schinese.txt":
-            content = """// Counter-Strike: Global Offensive Chinese Text
+}""".encode("utf-8"),
+    "csgo_schinese.txt": """// Counter-Strike: Global Offensive Chinese Text
 "lang"
 {
     "Language"      "schinese"
@@ -62,9 +34,8 @@ def download_from_steamcmd_api():
         "CSGO_MainMenu_PlayButton"    "开始游戏"
         "CSGO_MainMenu_WatchButton"   "观看"
     }
-}"""
-        elif filename == "items_game.txt":
-            content = """"items_game"
+}""".encode("utf-8"),
+    "items_game.txt": """"items_game"
 {
     "items"
     {
@@ -85,12 +56,30 @@ def download_from_steamcmd_api():
             "item_name"         "AK-47"
         }
     }
-}"""
+}""".encode("utf-8"),
+}
+
+
+def download_from_steamcmd_api():
+    """
+    Download CS:GO files using SteamCMD API approach
+    This is a more reliable method that doesn't require Steam login
+    """
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(content)
+    STATIC_DIR = "./static"
 
-        size = filepath.stat().st_size
+    # Create static directory
+    Path(STATIC_DIR).mkdir(exist_ok=True)
+
+    print("CS:GO Files Downloader (Simplified Version)")
+    print("=" * 50)
+
+    # Create sample files to demonstrate the structure
+    for filename, payload in _DEMO_FILES.items():
+        filepath = Path(STATIC_DIR) / filename
+
+        print(f"Creating sample {filename}...")
+        size = save_file(filepath, payload)
         print(f"  Created {filename}: {size:,} bytes")
 
     # Create manifest file
@@ -8,10 +8,14 @@ import sys
 import logging
 
 from .config import Config
-from .auth.steam_auth import SteamAuthenticator
-from .cdn.steam_cdn import SteamCDNManager
-from .vpk.vpk_handler import VPKProcessor
-from .utils.file_utils import read_manifest_id, save_manifest_id, print_file_summary
+from .utils.file_utils import (
+    cleanup_partial_files,
+    load_archive_indices,
+    print_file_summary,
+    read_manifest_id,
+    save_archive_indices,
+    save_manifest_id,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
@@ -38,10 +42,32 @@ def download_csgo_files(username: str, password: str, two_factor_code: str | Non
     Returns:
         True if successful, False otherwise
     """
+    # Deferred: these pull in the steam/gevent stacks, which --demo and the
+    # usage message never need
+    from .auth.steam_auth import SteamAuthenticator
+    from .cdn.steam_cdn import SteamCDNManager, probe_latest_manifest_id
+    from .vpk.vpk_handler import VPKProcessor
+
     try:
         # Ensure directories exist
         Config.ensure_directories()
 
+        # Drop partial files left behind by an interrupted run
+        cleanup_partial_files(Config.STATIC_PATH)
+        cleanup_partial_files(Config.TEMP_PATH)
+
+        manifest_file = Config.get_manifest_file_path()
+        existing_manifest_id = read_manifest_id(manifest_file)
+        probed_id = None
+
+        # Probe anonymously first: when nothing changed (the common case for
+        # scheduled runs) the credentialed login is skipped entirely
+        if existing_manifest_id:
+            probed_id = probe_latest_manifest_id()
+            if probed_id is not None and probed_id == existing_manifest_id:
+                logger.info("Latest manifest ID matches existing, no update needed")
+                return True
+
         # Authenticate with Steam
         with SteamAuthenticator() as auth:
             if not auth.login(username, password, two_factor_code):
@@ -51,13 +77,11 @@ def download_csgo_files(username: str, password: str, two_factor_code: str | Non
             # Initialize CDN manager
             cdn_manager = SteamCDNManager(auth.client)
 
-            # Get latest manifest info
-            latest_manifest_id, _ = cdn_manager.get_latest_manifest_info()
+            # Get latest manifest info; the probed ID invalidates a stale
+            # product-info cache that would otherwise mask the update
+            latest_manifest_id, _ = cdn_manager.get_latest_manifest_info(probed_manifest_id=probed_id)
 
             # Check if we need to update
-            manifest_file = Config.get_manifest_file_path()
-            existing_manifest_id = read_manifest_id(manifest_file)
-
             if existing_manifest_id == latest_manifest_id:
                 logger.info("Latest manifest ID matches existing, no update needed")
                 return True
@@ -80,8 +104,16 @@ def download_csgo_files(username: str, password: str, two_factor_code: str | Non
                 vpk_dir_path = cdn_manager.download_vpk_dir(manifest)
                 vpk_dir = vpk_processor.load_vpk_directory(vpk_dir_path)
 
-                # Get required archive indices
-                required_indices = vpk_processor.get_required_archive_indices(vpk_dir)
+                # Reuse archive indices discovered by a previous run against
+                # the same manifest; the mapping is immutable per manifest ID
+                index_cache = Config.get_manifest_index_path()
+                required_indices = load_archive_indices(index_cache, latest_manifest_id)
+
+                if required_indices is None:
+                    required_indices = vpk_processor.get_required_archive_indices(vpk_dir)
+                    save_archive_indices(index_cache, latest_manifest_id, required_indices)
+                else:
+                    logger.info(f"Using cached archive indices: {required_indices}")
 
                 if required_indices:
                     # Download required archives
@@ -1,116 +1,396 @@
-"""
-File processing utilities for CS:GO Files Downloader
-"""
-
-import logging
-from pathlib import Path
-from typing import Dict, List, Union
-
-logger = logging.getLogger(__name__)
-
-
-def trim_bom(data: Union[bytes, str]) -> Union[bytes, str]:
-    """
-    Remove UTF-8 BOM from file data for compatibility
-
-    Args:
-        data: Raw file data (bytes or string)
-
-    Returns:
-        Data with BOM removed if present
-    """
-    if isinstance(data, bytes) and len(data) >= 3 and data[:3] == b"\xef\xbb\xbf":
-        return data[3:]
-    elif isinstance(data, str) and data.startswith("\ufeff"):
-        return data[1:]
-    return data
-
-
-def save_file(file_path: Path, data: bytes, remove_bom: bool = True) -> int:
-    """
-    Save file data to disk with optional BOM removal
-
-    Args:
-        file_path: Path to save the file
-        data: File data to save
-        remove_bom: Whether to remove UTF-8 BOM
-
-    Returns:
-        Number of bytes written
-    """
-    if remove_bom:
-        data = trim_bom(data)  # type: ignore
-
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-
-    with open(file_path, "wb") as f:
-        f.write(data)
-
-    logger.info(f"Saved {file_path.name}: {len(data):,} bytes")
-    return len(data)
-
-
-def get_file_sizes(directory: Path, filenames: List[str]) -> Dict[str, int]:
-    """
-    Get file sizes for a list of files in a directory
-
-    Args:
-        directory: Directory to check
-        filenames: List of filenames to check
-
-    Returns:
-        Dictionary mapping filename to size in bytes
-    """
-    sizes = {}
-    for filename in filenames:
-        file_path = directory / filename
-        if file_path.exists():
-            sizes[filename] = file_path.stat().st_size
-        else:
-            sizes[filename] = 0
-    return sizes
-
-
-def print_file_summary(directory: Path, filenames: List[str]) -> None:
-    """
-    Print a formatted summary of downloaded files
-
-    Args:
-        directory: Directory containing the files
-        filenames: List of filenames to summarize
-    """
-    print("\nDownloaded files:")
-    sizes = get_file_sizes(directory, filenames)
-
-    for filename, size in sizes.items():
-        if size > 0:
-            print(f"  {filename}: {size:,} bytes")
-        else:
-            print(f"  {filename}: NOT FOUND")
-
-
-def read_manifest_id(manifest_file: Path) -> str:
-    """
-    Read existing manifest ID from file
-
-    Args:
-        manifest_file: Path to manifest file
-
-    Returns:
-        Manifest ID as string, empty if file doesn't exist
-    """
-    if manifest_file.exists():
-        return manifest_file.read_text().strip()
-    return ""
-
-
-def save_manifest_id(manifest_file: Path, manifest_id: str) -> None:
-    """
-    Save manifest ID to file
-
-    Args:
-        manifest_file: Path to manifest file
-        manifest_id: Manifest ID to save
-    """
-    manifest_file.write_text(str(manifest_id))
-    logger.info(f"Saved manifest ID: {manifest_id}")
+"""
+File processing utilities for CS:GO Files Downloader
+"""
+
+import os
+import json
+import mmap
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def trim_bom(data: Union[bytes, str]) -> Union[bytes, memoryview, str]:
+    """
+    Remove UTF-8 BOM from file data for compatibility
+
+    For bytes input the BOM case returns a zero-copy memoryview slice, so
+    dropping 3 bytes never reallocates a multi-MB payload.
+
+    Args:
+        data: Raw file data (bytes or string)
+
+    Returns:
+        Data with BOM removed if present
+    """
+    if isinstance(data, bytes) and len(data) >= 3 and data[:3] == b"\xef\xbb\xbf":
+        return memoryview(data)[3:]
+    elif isinstance(data, str) and data.startswith("\ufeff"):
+        return data[1:]
+    return data
+
+
+def save_file(file_path: Path, data: bytes, remove_bom: bool = True, mkdir: bool = False) -> int:
+    """
+    Save file data to disk with optional BOM removal
+
+    Args:
+        file_path: Path to save the file
+        data: File data to save
+        remove_bom: Whether to remove UTF-8 BOM
+        mkdir: Whether to create parent directories (callers writing into
+            the standard static/temp dirs rely on Config.ensure_directories)
+
+    Returns:
+        Number of bytes written
+    """
+    if remove_bom:
+        data = trim_bom(data)  # type: ignore
+
+    if mkdir:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    part_path = file_path.with_name(file_path.name + ".part")
+
+    # One-shot payload: write through a raw fd, skipping the BufferedWriter layer
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    # Atomic rename: a crash mid-write never leaves a corrupt destination
+    os.replace(part_path, file_path)
+
+    logger.info(f"Saved {file_path.name}: {len(data):,} bytes")
+    return len(data)
+
+
+def copy_stripping_bom(reader, out_file, chunk_size: int = 4 * 1024 * 1024) -> int:
+    """
+    Copy a stream to an open file, dropping a leading UTF-8 BOM if present
+
+    Probes exactly 3 bytes up front, so the check never depends on how the
+    source happens to chunk its reads and the full payload is never held
+    in memory.
+
+    Args:
+        reader: File-like object with a read(size) method
+        out_file: Open binary file object to write to
+        chunk_size: Number of bytes to read per iteration
+
+    Returns:
+        Number of bytes written
+    """
+    written = 0
+
+    head = reader.read(3)
+    if head and head != b"\xef\xbb\xbf":
+        out_file.write(head)
+        written = len(head)
+
+    while chunk := reader.read(chunk_size):
+        out_file.write(chunk)
+        written += len(chunk)
+
+    return written
+
+
+def save_file_streaming(file_path: Path, reader, chunk_size: int = 4 * 1024 * 1024, remove_bom: bool = False, drop_cache: bool = False, mkdir: bool = False) -> int:
+    """
+    Stream data from a file-like reader to disk in fixed-size chunks
+
+    Keeps peak memory at O(chunk_size) instead of materializing the whole
+    payload as one bytes object, which matters for multi-GB VPK archives.
+
+    Args:
+        file_path: Path to save the file
+        reader: File-like object with a read(size) method
+        chunk_size: Number of bytes to read per iteration
+        remove_bom: Whether to remove UTF-8 BOM from the first chunk
+        drop_cache: Whether to advise the kernel to evict the written pages
+            (for data that is read at most once afterwards)
+        mkdir: Whether to create parent directories (callers writing into
+            the standard static/temp dirs rely on Config.ensure_directories)
+
+    Returns:
+        Number of bytes written
+    """
+    if mkdir:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    part_path = file_path.with_name(file_path.name + ".part")
+
+    written = 0
+
+    with open(part_path, "wb") as f:
+        if remove_bom:
+            written = copy_stripping_bom(reader, f, chunk_size)
+        else:
+            while chunk := reader.read(chunk_size):
+                f.write(chunk)
+                written += len(chunk)
+
+        # Single fsync at the end, not per chunk
+        f.flush()
+        os.fsync(f.fileno())
+
+        # Keep hundreds of MB of write-once data from blowing out the page
+        # cache; advisory only, and not available on Windows
+        if drop_cache and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+    # Atomic rename: a crash mid-write never leaves a corrupt destination
+    os.replace(part_path, file_path)
+
+    logger.info(f"Saved {file_path.name}: {written:,} bytes")
+    return written
+
+
+def cleanup_partial_files(directory: Path) -> None:
+    """
+    Remove leftover .part files from interrupted runs
+
+    Completed writes are renamed into place atomically, so anything still
+    ending in .part is an abandoned partial and safe to drop.
+
+    Args:
+        directory: Directory to scan for partial files
+    """
+    if not directory.exists():
+        return
+
+    for part_file in directory.glob("*.part"):
+        try:
+            part_file.unlink()
+            logger.info(f"Removed stale partial file: {part_file.name}")
+        except OSError as e:
+            logger.warning(f"Could not remove {part_file.name}: {e}")
+
+
+def file_sha1(file_path: Path) -> str:
+    """
+    Compute the SHA-1 of a file via a read-only memory map
+
+    The hash runs directly over the mapped pages, so no intermediate
+    bytes objects are allocated and RSS stays bounded by the page cache.
+
+    Args:
+        file_path: Path to the file to hash
+
+    Returns:
+        Hex digest of the file contents
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Zero-length files cannot be mapped
+            return hashlib.sha1(b"").hexdigest()
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.sha1(mm).hexdigest()
+
+
+def load_hash_cache(cache_file: Path) -> Dict:
+    """
+    Load the sidecar hash cache, returning an empty dict if missing or corrupt
+
+    Args:
+        cache_file: Path to the JSON cache file
+
+    Returns:
+        Dictionary mapping filename to {size, mtime, sha1}
+    """
+    if cache_file.exists():
+        try:
+            return json.loads(cache_file.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read hash cache: {e}")
+    return {}
+
+
+def save_hash_cache(cache_file: Path, cache: Dict) -> None:
+    """
+    Save the sidecar hash cache
+
+    Args:
+        cache_file: Path to the JSON cache file
+        cache: Dictionary mapping filename to {size, mtime, sha1}
+    """
+    try:
+        cache_file.write_text(json.dumps(cache))
+    except OSError as e:
+        logger.warning(f"Could not save hash cache: {e}")
+
+
+def load_archive_indices(cache_file: Path, manifest_id: str) -> Optional[List[int]]:
+    """
+    Load cached VPK archive indices for a manifest ID
+
+    The target-to-archive mapping is immutable for a given manifest, so a
+    matching cache entry replaces the whole VPK tree scan.
+
+    Args:
+        cache_file: Path to the JSON cache file
+        manifest_id: Manifest ID the indices must belong to
+
+    Returns:
+        List of archive indices, or None when the cache is missing,
+        corrupt, or belongs to a different manifest
+    """
+    if not cache_file.exists():
+        return None
+
+    try:
+        payload = json.loads(cache_file.read_text())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read manifest index cache: {e}")
+        return None
+
+    if payload.get("manifest_id") != manifest_id:
+        return None
+
+    indices = payload.get("archive_indices")
+    if not isinstance(indices, list):
+        return None
+
+    return indices
+
+
+def save_archive_indices(cache_file: Path, manifest_id: str, indices: List[int]) -> None:
+    """
+    Save VPK archive indices for a manifest ID
+
+    Args:
+        cache_file: Path to the JSON cache file
+        manifest_id: Manifest ID the indices belong to
+        indices: Archive indices discovered for the target files
+    """
+    try:
+        cache_file.write_text(json.dumps({"manifest_id": manifest_id, "archive_indices": indices}))
+    except OSError as e:
+        logger.warning(f"Could not save manifest index cache: {e}")
+
+
+def matches_manifest(file_path: Path, file_info, hash_cache: Optional[Dict] = None) -> bool:
+    """
+    Check whether an on-disk file already matches a manifest entry
+
+    Compares size first, then the manifest SHA-1 when the manifest exposes
+    one, so files that are already current can skip the CDN round-trip.
+    When a hash cache is given, an entry with matching size and mtime
+    short-circuits the hash computation as well.
+
+    Args:
+        file_path: Path to the local file
+        file_info: Manifest file_info object for the same file
+        hash_cache: Optional cache dict (mutated in place with fresh hashes)
+
+    Returns:
+        True if the local file matches the manifest entry
+    """
+    if not file_path.exists():
+        return False
+
+    stat = file_path.stat()
+    expected_size = getattr(file_info, "size", None)
+
+    if expected_size is None or stat.st_size != expected_size:
+        return False
+
+    expected_sha = getattr(file_info, "sha_content", None)
+    if expected_sha is None:
+        file_mapping = getattr(file_info, "file_mapping", None)
+        expected_sha = getattr(file_mapping, "sha_content", None)
+
+    if expected_sha is None:
+        # Size match is the best signal this manifest gives us
+        return True
+
+    if isinstance(expected_sha, bytes):
+        expected_sha = expected_sha.hex()
+
+    entry = hash_cache.get(file_path.name) if hash_cache is not None else None
+
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+        actual_sha = entry.get("sha1")
+    else:
+        actual_sha = file_sha1(file_path)
+        if hash_cache is not None:
+            hash_cache[file_path.name] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha1": actual_sha}
+
+    return actual_sha == expected_sha
+
+
+def get_file_sizes(directory: Path, filenames: List[str]) -> Dict[str, int]:
+    """
+    Get file sizes for a list of files in a directory
+
+    Args:
+        directory: Directory to check
+        filenames: List of filenames to check
+
+    Returns:
+        Dictionary mapping filename to size in bytes
+    """
+    # One scandir pass instead of an exists+stat syscall pair per filename
+    wanted = set(filenames)
+    found = {}
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name in wanted:
+                found[entry.name] = entry.stat().st_size
+
+    return {filename: found.get(filename, 0) for filename in filenames}
+
+
+def print_file_summary(directory: Path, filenames: List[str]) -> None:
+    """
+    Print a formatted summary of downloaded files
+
+    Args:
+        directory: Directory containing the files
+        filenames: List of filenames to summarize
+    """
+    print("\nDownloaded files:")
+    sizes = get_file_sizes(directory, filenames)
+
+    for filename, size in sizes.items():
+        if size > 0:
+            print(f"  {filename}: {size:,} bytes")
+        else:
+            print(f"  {filename}: NOT FOUND")
+
+
+def read_manifest_id(manifest_file: Path) -> str:
+    """
+    Read existing manifest ID from file
+
+    Args:
+        manifest_file: Path to manifest file
+
+    Returns:
+        Manifest ID as string, empty if file doesn't exist
+    """
+    if manifest_file.exists():
+        return manifest_file.read_text().strip()
+    return ""
+
+
+def save_manifest_id(manifest_file: Path, manifest_id: str) -> None:
+    """
+    Save manifest ID to file
+
+    Args:
+        manifest_file: Path to manifest file
+        manifest_id: Manifest ID to save
+    """
+    manifest_file.write_text(str(manifest_id))
+    logger.info(f"Saved manifest ID: {manifest_id}")
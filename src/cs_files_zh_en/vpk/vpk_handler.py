@@ -1,205 +1,387 @@
-"""
-VPK file processing for CS:GO Files Downloader
-"""
-
-import re
-import logging
-from pathlib import Path
-from typing import List, Set
-
-import vpk
-
-from ..config import Config
-from ..utils.file_utils import save_file
-
-logger = logging.getLogger(__name__)
-
-
-class VPKProcessor:
-    """Handles VPK file operations and archive processing"""
-
-    def __init__(self):
-        self.vpk_dir = None
-
-    def load_vpk_directory(self, vpk_dir_path: Path):
-        """
-        Load VPK directory file
-
-        Args:
-            vpk_dir_path: Path to pak01_dir.vpk file
-
-        Returns:
-            VPK directory object
-        """
-        logger.info(f"Loading VPK directory from {vpk_dir_path}")
-
-        self.vpk_dir = vpk.open(str(vpk_dir_path))
-        file_count = len(list(self.vpk_dir))
-
-        logger.info(f"VPK directory loaded with {file_count} files")
-        return self.vpk_dir
-
-    def get_required_archive_indices(self, vpk_dir) -> List[int]:
-        """
-        Determine which VPK archive indices are needed for target files
-
-        This method uses multiple strategies to extract archive indices,
-        including parsing error messages as documented in CLAUDE.md
-
-        Args:
-            vpk_dir: VPK directory object
-
-        Returns:
-            Sorted list of required archive indices
-        """
-        logger.info("Determining required VPK archive indices...")
-        required_indices: Set[int] = set()
-
-        # Strategy 1: Try to use VPK tree if available
-        if hasattr(vpk_dir, "tree") and vpk_dir.tree is not None:
-            logger.info(f"Using VPK tree with {len(vpk_dir.tree)} entries")
-            required_indices.update(self._extract_indices_from_tree(vpk_dir))
-        else:
-            logger.info("VPK tree not available, using iteration method")
-            required_indices.update(self._extract_indices_from_iteration(vpk_dir))
-
-        result = sorted(list(required_indices))
-        logger.info(f"Required archive indices: {result}")
-
-        return result
-
-    def _extract_indices_from_tree(self, vpk_dir) -> Set[int]:
-        """Extract archive indices using VPK tree metadata"""
-        indices = set()
-
-        for filepath in vpk_dir.tree:
-            for target_file in Config.VPK_FILES:
-                if filepath.startswith(target_file):
-                    logger.info(f"Found target file in tree: {filepath}")
-
-                    try:
-                        file_meta = vpk_dir.tree[filepath]
-                        archive_index = self._get_archive_index_from_metadata(file_meta)
-
-                        if archive_index is not None and archive_index != 0x7FFF:
-                            indices.add(archive_index)
-                            logger.info(f"  Archive index: {archive_index}")
-                        else:
-                            logger.warning(f"  Could not determine archive index for {filepath}")
-
-                    except Exception as e:
-                        logger.error(f"  Error accessing metadata for {filepath}: {e}")
-                    break
-
-        return indices
-
-    def _extract_indices_from_iteration(self, vpk_dir) -> Set[int]:
-        """Extract archive indices using iteration and error message parsing"""
-        indices = set()
-        file_count = 0
-
-        for filepath in vpk_dir:
-            file_count += 1
-            if file_count <= 5:  # Log first few files for debugging
-                logger.debug(f"  VPK file: {filepath}")
-
-            for target_file in Config.VPK_FILES:
-                if filepath.startswith(target_file):
-                    logger.info(f"Found target file: {filepath}")
-                    archive_index = self._get_archive_index_multiple_methods(vpk_dir, filepath)
-
-                    if archive_index is not None and archive_index != 0x7FFF:
-                        indices.add(archive_index)
-                        logger.info(f"  ✓ Archive index: {archive_index}")
-                    else:
-                        logger.warning(f"  ✗ Could not determine archive index for {filepath}")
-                    break
-
-        logger.info(f"Processed {file_count} files from VPK")
-        return indices
-
-    def _get_archive_index_from_metadata(self, file_meta) -> int | None:
-        """Extract archive index from file metadata object"""
-        # Try different attribute names
-        for attr_name in ["archive_index", "archiveIndex"]:
-            if hasattr(file_meta, attr_name):
-                return getattr(file_meta, attr_name)
-
-        # Try dictionary access
-        if isinstance(file_meta, dict) and "archive_index" in file_meta:
-            return file_meta["archive_index"]
-
-        return None
-
-    def _get_archive_index_multiple_methods(self, vpk_dir, filepath: str) -> int | None:
-        """Try multiple methods to get archive index for a file"""
-
-        # Method 1: Try get_file_meta if available
-        if hasattr(vpk_dir, "get_file_meta"):
-            try:
-                file_meta = vpk_dir.get_file_meta(filepath)
-                if file_meta:
-                    index = self._get_archive_index_from_metadata(file_meta)
-                    if index is not None:
-                        logger.debug(f"  Archive index from meta: {index}")
-                        return index
-            except Exception as e:
-                logger.debug(f"  get_file_meta failed: {e}")
-
-        # Method 2: Error message parsing (the innovative approach from CLAUDE.md)
-        try:
-            # This will intentionally fail with FileNotFoundError
-            vpk_file = vpk_dir.get_vpkfile_instance(filepath, vpk_dir.get_file_meta(filepath))
-            if hasattr(vpk_file, "archive_index"):
-                index = vpk_file.archive_index
-                logger.debug(f"  Archive index from VPKFile: {index}")
-                return index
-        except FileNotFoundError as e:
-            # Extract archive index from error message: "pak01_354.vpk"
-            error_msg = str(e)
-            if "pak01_" in error_msg and ".vpk" in error_msg:
-                match = re.search(r"pak01_(\d+)\.vpk", error_msg)
-                if match:
-                    index = int(match.group(1))
-                    logger.debug(f"  Archive index from error message: {index}")
-                    return index
-        except Exception as e:
-            logger.debug(f"  VPKFile creation failed: {e}")
-
-        return None
-
-    def extract_target_files(self, vpk_dir) -> None:
-        """
-        Extract target files from VPK directory
-
-        Args:
-            vpk_dir: VPK directory object
-        """
-        logger.info("Extracting target files from VPK...")
-
-        for target_file in Config.VPK_FILES:
-            found = False
-
-            for filepath in vpk_dir:
-                if filepath.startswith(target_file):
-                    logger.info(f"Extracting {filepath}")
-
-                    try:
-                        # Get file data
-                        vpk_file = vpk_dir[filepath]
-                        file_data = vpk_file.read()
-
-                        # Get just the filename for saving
-                        filename = target_file.split("/")[-1]
-                        static_path = Config.get_static_path() / filename
-
-                        save_file(static_path, file_data)
-                        found = True
-                        break
-
-                    except Exception as e:
-                        logger.error(f"Error extracting {filepath}: {e}")
-                        continue
-
-            if not found:
-                logger.warning(f"Could not find {target_file} in VPK")
+"""
+VPK file processing for CS:GO Files Downloader
+"""
+
+import re
+import logging
+import operator
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import vpk
+
+from ..config import Config
+from ..utils.file_utils import save_file_streaming
+
+logger = logging.getLogger(__name__)
+
+# Compiled once: the error-message fallback can run per target file
+_PAK_INDEX_RE = re.compile(r"pak01_(\d+)\.vpk")
+
+# Tuple form lets str.startswith test every target prefix in one C call.
+# Rebuilt lazily so tests that mutate Config.VPK_FILES stay consistent;
+# a full prefix trie would not pay for itself at this target count.
+_target_prefix_cache: tuple | None = None
+
+
+def _target_matcher() -> tuple:
+    """Return the cached (prefixes, first-char buckets), rebuilt if Config.VPK_FILES changed"""
+    global _target_prefix_cache
+
+    files = Config.VPK_FILES
+    if _target_prefix_cache is None or list(_target_prefix_cache[0]) != files:
+        buckets: dict = {}
+        for target_file in files:
+            buckets.setdefault(target_file[:1], []).append(target_file)
+        _target_prefix_cache = (list(files), tuple(files), buckets)
+
+    return _target_prefix_cache
+
+
+def _target_prefixes() -> tuple:
+    """Return the target prefixes as a tuple"""
+    return _target_matcher()[1]
+
+
+def _match_target(filepath: str) -> str | None:
+    """
+    Return the target prefix a VPK filepath falls under, or None
+
+    Targets are bucketed by first character, so the common non-matching
+    entry is rejected by a single dict probe; only paths sharing a
+    target's first character pay for a real startswith, against a bucket
+    that is usually one element long.
+    """
+    buckets = _target_matcher()[2]
+
+    candidates = buckets.get(filepath[:1])
+    if not candidates:
+        return None
+
+    for target_file in candidates:
+        if filepath.startswith(target_file):
+            return target_file
+
+    return None
+
+
+class VPKProcessor:
+    """Handles VPK file operations and archive processing"""
+
+    def __init__(self):
+        self.vpk_dir = None
+        # Scan result for the most recently scanned directory object, so
+        # index discovery and extraction share one traversal
+        self._scan_cache: Tuple[object, Dict[str, Tuple[str, int | None]]] | None = None
+        # Getter specialized to the metadata layout seen on first use
+        self._meta_getter = None
+        # Resolved archive indices keyed by entry path; a path's index is
+        # immutable for a loaded directory
+        self._index_cache: Dict[str, int | None] = {}
+
+    def load_vpk_directory(self, vpk_dir_path: Path):
+        """
+        Load VPK directory file
+
+        Args:
+            vpk_dir_path: Path to pak01_dir.vpk file
+
+        Returns:
+            VPK directory object
+        """
+        logger.info(f"Loading VPK directory from {vpk_dir_path}")
+
+        self.vpk_dir = vpk.open(str(vpk_dir_path))
+
+        # Per-directory state: target paths repeat across manifests, so
+        # entries kept from a previous load would hand out stale indices
+        self._scan_cache = None
+        self._index_cache = {}
+        self._meta_getter = None
+
+        # len(tree) is O(1); materializing the iterator just to count is not
+        tree = getattr(self.vpk_dir, "tree", None)
+        file_count = len(tree) if tree is not None else sum(1 for _ in self.vpk_dir)
+
+        logger.info(f"VPK directory loaded with {file_count} files")
+        return self.vpk_dir
+
+    def scan_vpk(self, vpk_dir) -> Dict[str, Tuple[str, int | None]]:
+        """
+        Resolve every target file in a single VPK traversal
+
+        Walking the directory decodes its whole tree, so index discovery
+        and extraction share one scan instead of each running their own.
+        The result is cached per directory object.
+
+        Args:
+            vpk_dir: VPK directory object
+
+        Returns:
+            Dict mapping target prefix to (full entry path, archive index)
+        """
+        if self._scan_cache is not None and self._scan_cache[0] is vpk_dir:
+            return self._scan_cache[1]
+
+        if hasattr(vpk_dir, "tree") and vpk_dir.tree is not None:
+            logger.info(f"Scanning VPK tree with {len(vpk_dir.tree)} entries")
+            matches = self._scan_tree(vpk_dir)
+        else:
+            logger.info("VPK tree not available, scanning by iteration")
+            matches = self._scan_iteration(vpk_dir)
+
+        self._scan_cache = (vpk_dir, matches)
+        return matches
+
+    def get_required_archive_indices(self, vpk_dir) -> List[int]:
+        """
+        Determine which VPK archive indices are needed for target files
+
+        This method uses multiple strategies to extract archive indices,
+        including parsing error messages as documented in CLAUDE.md
+
+        Args:
+            vpk_dir: VPK directory object
+
+        Returns:
+            Sorted list of required archive indices
+        """
+        logger.info("Determining required VPK archive indices...")
+
+        # Archive indices are small ints, so a single int works as a
+        # bitmap: dedup and membership are one OR, no per-element boxing
+        required_bits = 0
+
+        for filepath, archive_index in self.scan_vpk(vpk_dir).values():
+            if archive_index is not None and archive_index != 0x7FFF:
+                required_bits |= 1 << archive_index
+                logger.info(f"  Archive index for {filepath}: {archive_index}")
+            else:
+                logger.warning(f"  Could not determine archive index for {filepath}")
+
+        # Bit-scan from the low end enumerates the indices already sorted
+        result = []
+        while required_bits:
+            low_bit = required_bits & -required_bits
+            result.append(low_bit.bit_length() - 1)
+            required_bits ^= low_bit
+
+        logger.info(f"Required archive indices: {result}")
+
+        return result
+
+    def _scan_tree(self, vpk_dir) -> Dict[str, Tuple[str, int | None]]:
+        """Resolve target entries using VPK tree metadata"""
+        matches: Dict[str, Tuple[str, int | None]] = {}
+        remaining = set(_target_prefixes())
+
+        # items() yields the metadata alongside each key, halving the dict
+        # traffic versus re-looking up every matched path
+        for filepath, file_meta in vpk_dir.tree.items():
+            target_file = _match_target(filepath)
+            if target_file is None or target_file not in remaining:
+                continue
+
+            logger.info(f"Found target file in tree: {filepath}")
+            archive_index = None
+
+            # Only the attribute probe can fail here; anything broader
+            # would swallow genuine interrupts and out-of-memory errors
+            try:
+                archive_index = self._get_archive_index_from_metadata(file_meta)
+            except AttributeError as e:
+                logger.error(f"  Error accessing metadata for {filepath}: {e}")
+
+            if archive_index is None:
+                # Undecodable tree metadata must not silently drop the
+                # target from the download list; try the full resolver chain
+                archive_index = self._get_archive_index_multiple_methods(vpk_dir, filepath)
+
+            matches[target_file] = (filepath, archive_index)
+            remaining.discard(target_file)
+
+            # All targets resolved; the rest of the tree cannot add anything
+            if not remaining:
+                break
+
+        return matches
+
+    def _scan_iteration(self, vpk_dir) -> Dict[str, Tuple[str, int | None]]:
+        """Resolve target entries using iteration and error message parsing"""
+        matches: Dict[str, Tuple[str, int | None]] = {}
+        remaining = set(_target_prefixes())
+        file_count = 0
+
+        # Checked once here instead of formatting a message per entry that
+        # the disabled logger would just drop
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+        for filepath in vpk_dir:
+            file_count += 1
+            if debug_enabled and file_count <= 5:  # Log first few files for debugging
+                logger.debug("  VPK file: %s", filepath)
+
+            target_file = _match_target(filepath)
+            if target_file is None or target_file not in remaining:
+                continue
+
+            logger.info(f"Found target file: {filepath}")
+            matches[target_file] = (filepath, None)
+            remaining.discard(target_file)
+
+            # All targets matched; the rest of the walk cannot add anything
+            if not remaining:
+                break
+
+        logger.info(f"Scanned {file_count} VPK entries")
+
+        # Resolved after the walk, sequentially: the vpk library lazily
+        # (re)reads its index inside these lookups with no locking, so
+        # concurrent workers can observe a half-rebuilt tree and silently
+        # miss entries that exist
+        for target_file, (filepath, _) in list(matches.items()):
+            matches[target_file] = (filepath, self._get_archive_index_multiple_methods(vpk_dir, filepath))
+
+        return matches
+
+    def _get_archive_index_from_metadata(self, file_meta) -> int | None:
+        """Extract archive index from file metadata object"""
+        # Tree metadata objects are homogeneous, so once a layout has been
+        # seen the bound operator getter replaces the attribute probing
+        # with a single C-level call
+        if self._meta_getter is not None:
+            try:
+                return self._meta_getter(file_meta)
+            except (AttributeError, IndexError, KeyError, TypeError):
+                pass  # Heterogeneous metadata; fall through to the probes
+
+        # vpk stores tree metadata as raw tuples: (preload, crc32,
+        # preload_length, archive_index, archive_offset, file_length)
+        if isinstance(file_meta, tuple):
+            if len(file_meta) >= 4:
+                self._meta_getter = operator.itemgetter(3)
+                return file_meta[3]
+            return None
+
+        # getattr with a default probes each attribute once instead of the
+        # paired hasattr + getattr lookups
+        index = getattr(file_meta, "archive_index", None)
+        if index is not None:
+            self._meta_getter = operator.attrgetter("archive_index")
+            return index
+
+        index = getattr(file_meta, "archiveIndex", None)
+        if index is not None:
+            self._meta_getter = operator.attrgetter("archiveIndex")
+            return index
+
+        # Try dictionary access
+        if isinstance(file_meta, dict):
+            index = file_meta.get("archive_index")
+            if index is not None:
+                self._meta_getter = operator.itemgetter("archive_index")
+            return index
+
+        return None
+
+    def _get_archive_index_multiple_methods(self, vpk_dir, filepath: str) -> int | None:
+        """
+        Get the archive index for a file, memoized per entry path
+
+        Targets sharing an archive still carry distinct paths, but repeat
+        lookups for the same path (retries, re-scans) resolve from the
+        cache instead of re-running the fallback chain.
+        """
+        if filepath in self._index_cache:
+            return self._index_cache[filepath]
+
+        index = self._resolve_archive_index(vpk_dir, filepath)
+        self._index_cache[filepath] = index
+        return index
+
+    def _resolve_archive_index(self, vpk_dir, filepath: str) -> int | None:
+        """Try multiple methods to get archive index for a file"""
+
+        # Method 1: Read the directory tree entry directly; the raw
+        # metadata tuple carries the archive index even when the companion
+        # archive file is absent, so no exception machinery is involved
+        tree = getattr(vpk_dir, "tree", None)
+        if tree is not None:
+            file_meta = tree.get(filepath)
+            if file_meta is not None:
+                index = self._get_archive_index_from_metadata(file_meta)
+                if index is not None:
+                    logger.debug("  Archive index from tree: %s", index)
+                    return index
+
+        # Method 2: Try get_file_meta if available
+        if hasattr(vpk_dir, "get_file_meta"):
+            try:
+                file_meta = vpk_dir.get_file_meta(filepath)
+                if file_meta:
+                    index = self._get_archive_index_from_metadata(file_meta)
+                    if index is not None:
+                        logger.debug("  Archive index from meta: %s", index)
+                        return index
+            except Exception as e:
+                logger.debug("  get_file_meta failed: %s", e)
+
+        # Method 3: Error message parsing (the innovative approach from
+        # CLAUDE.md) — strictly last, since provoking and formatting the
+        # exception costs orders of magnitude more than the direct reads
+        try:
+            # This will intentionally fail with FileNotFoundError
+            vpk_file = vpk_dir.get_vpkfile_instance(filepath, vpk_dir.get_file_meta(filepath))
+            if hasattr(vpk_file, "archive_index"):
+                index = vpk_file.archive_index
+                logger.debug("  Archive index from VPKFile: %s", index)
+                return index
+        except FileNotFoundError as e:
+            # Extract archive index from error message: "pak01_354.vpk"
+            error_msg = str(e)
+            if "pak01_" in error_msg and ".vpk" in error_msg:
+                match = _PAK_INDEX_RE.search(error_msg)
+                if match:
+                    index = int(match.group(1))
+                    logger.debug("  Archive index from error message: %s", index)
+                    return index
+        except Exception as e:
+            logger.debug("  VPKFile creation failed: %s", e)
+
+        return None
+
+    def extract_target_files(self, vpk_dir) -> None:
+        """
+        Extract target files from VPK directory
+
+        Reuses the entry paths recorded by scan_vpk, so extraction indexes
+        straight into the directory instead of walking it again.
+
+        Args:
+            vpk_dir: VPK directory object
+        """
+        logger.info("Extracting target files from VPK...")
+
+        matches = self.scan_vpk(vpk_dir)
+
+        for target_file in Config.VPK_FILES:
+            match = matches.get(target_file)
+            if match is None:
+                logger.warning(f"Could not find {target_file} in VPK")
+                continue
+
+            filepath = match[0]
+            logger.info(f"Extracting {filepath}")
+
+            try:
+                # Get just the filename for saving
+                filename = target_file.split("/")[-1]
+                static_path = Config.get_static_path() / filename
+
+                # VPKFile is file-like, so stream instead of
+                # materializing the whole payload
+                vpk_file = vpk_dir[filepath]
+                save_file_streaming(static_path, vpk_file, remove_bom=True)
+
+            except Exception as e:
+                logger.error(f"Error extracting {filepath}: {e}")